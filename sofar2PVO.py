@@ -27,126 +27,221 @@ import ipaddress
 import json
 import logging
 import os
+import signal
 import sys
+import time
 from datetime import datetime
 from pathlib import Path
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from sofarDevice import sofarDevice
 
 
+# http session for pvoutput.org, keeps the connection alive between uploads
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=4, max_retries=Retry(total=3, backoff_factor=0.3)))
+_session.headers.update({'User-Agent': 'sofar2PVO/1.0'})
+
+
 def isValidString(s):
     return bool(isinstance(s, str) and s and not s.isspace())
 
 
-os.chdir(os.path.dirname(sys.argv[0]))
-
-# handle config file
-configParser = configparser.RawConfigParser()
-configFilePath = Path(os.getcwd())
-configFilePath = configFilePath.joinpath('config.cfg')
-if not configFilePath.is_file():
-    print('Config file not found at: ' + str(configFilePath))
-    sys.exit(1)
-configParser.read(configFilePath)
-# prepare log file
-allowedLogLevels = ['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG']
-cfgLogLevel = configParser.get('general', 'log_level')
-if not isValidString(cfgLogLevel) or not (cfgLogLevel.upper()) in allowedLogLevels:
-    configParser.set('general', 'log_level', 'ERROR')
-logPath = Path(configParser.get('general', 'log_path'))
-if not logPath.is_dir():
-    logPath = Path(os.getcwd())
-logging.basicConfig(filename=logPath.joinpath('sofar2PVO.log'), filemode='a', level=getattr(logging, configParser.get('general', 'log_level')), format='%(asctime)s - %(levelname)s: %(message)s')
-# open protocol file
-sofarProtocolPath = Path(os.getcwd())
-sofarProtocolPath = sofarProtocolPath.joinpath('sofarProtocol.json')
-if not sofarProtocolPath.is_file():
-    logging.error('File with protocol definition not found at: ' + str(sofarProtocolPath))
-    print('File with protocol definition not found at: ' + str(sofarProtocolPath))
-    sys.exit(1)
-spFile = open(sofarProtocolPath)
-sofarProtocol = json.load(spFile)
-spFile.close()
-# check optional pvoutput.org parameters
-allRegRanges = ['GridOutput', 'SystemInfo', 'EnergyTodayTotals', 'PVOutput']
-requiredRegRanges = ['GridOutput', 'EnergyTodayTotals', 'PVOutput']
-for i in range(7, 13, 1):
-    tmp = configParser.get('pvoutput', 'pvo_v' + str(i))
-    if isValidString(tmp):
-        tmp = tmp.split('.')
-        if len(tmp) == 2 and tmp[0] in allRegRanges:
-            requiredRegRanges += [tmp[0]]
-        else:
-            configParser.set('pvoutput', 'pvo_v' + str(i), '')
-    else:
-        configParser.set('pvoutput', 'pvo_v' + str(i), '')
-requiredRegRanges = list(set(requiredRegRanges))
-# check if ip address is valid
-inverter_ip = configParser.get('SofarInverter', 'inverter_ip')
-try:
-    ipaddress.ip_address(inverter_ip)
-except Exception as err:
-    logging.error('IP address: \'%s\' is not valid', str(inverter_ip))
-    print('IP address: \'' + str(inverter_ip) + '\' is not valid.')
-    sys.exit(1)
-inverter_port = int(configParser.get('SofarInverter', 'inverter_port'))
-inverter_sn = int(configParser.get('SofarInverter', 'inverter_sn'))
-# create object to connect to the inverter
-sDev = sofarDevice(configParser.get('SofarInverter', 'inverter_ip'),
-                   int(configParser.get('SofarInverter', 'inverter_port')),
-                   int(configParser.get('SofarInverter', 'inverter_sn')),
-                   float(configParser.get('pvoutput', 'pvo_system_size')), sofarProtocol)
-# read current pv data from the inverter
-currentValues = sDev.getRegisterRangeData(requiredRegRanges)
-# sanity check
-if not currentValues:
-    # something went wrong -> nothing to do -> exit
-    sys.exit(1)
-for regRangeName in sofarProtocol:
-    if regRangeName not in currentValues:
-        # required registers have not been read from the inverter
-        tmpStr = "Could not get %s from the inverter - exiting...", regRangeName
+def getFlag(configParser, section, option):
+    # a missing or blank option is false, anything else has to be a valid boolean
+    if not isValidString(configParser.get(section, option, fallback='')):
+        return False
+    return configParser.getboolean(section, option)
+
+
+def _terminate(signum, frame):
+    # leave the upload loop on SIGTERM, the with-statement closes the connection to the inverter
+    raise SystemExit(0)
+
+
+def loadProtocol(sofarProtocolPath):
+    # read the protocol definition and prepare it for the inverter
+    spFile = open(sofarProtocolPath)
+    sofarProtocol = json.load(spFile)
+    spFile.close()
+    return sofarDevice.prepareProtocol(sofarProtocol)
+
+
+def collect(sDev, cfg, requiredRegRanges):
+    # read current pv data from the inverter and check it, returns the data and the total power or None
+    currentValues = sDev.getRegisterRangeData(requiredRegRanges)
+    # sanity check
+    if not currentValues:
+        # something went wrong -> nothing to do
+        return None
+    for regRangeName in requiredRegRanges:
+        if regRangeName not in currentValues:
+            # required registers have not been read from the inverter
+            tmpStr = "Could not get " + regRangeName + " from the inverter"
+            logging.error(tmpStr)
+            print(tmpStr)
+            return None
+    if cfg['system_size'] > 0 and currentValues['EnergyTodayTotals']['PV_Generation_Today'] > 10 * cfg['system_size']:
+        tmpStr = "Energy yield today too large for system size (" + str(cfg['system_size']) + "kW): " + str(currentValues['EnergyTodayTotals']['PV_Generation_Today']) + "kWh"
         logging.error(tmpStr)
         print(tmpStr)
-        sys.exit(1)
-if float(configParser.get('pvoutput', 'pvo_system_size')) > 0 and currentValues['EnergyTodayTotals']['PV_Generation_Today'] > 10 * float(configParser.get('pvoutput', 'pvo_system_size')):
-    tmpStr = "Energy yield today too large for system size (" + configParser.get('pvoutput', 'pvo_system_size') + "kW): " + str(currentValues['EnergyTodayTotals']['PV_Generation_Today']) + "kWh"
-    logging.error(tmpStr)
-    print(tmpStr)
-    sys.exit(1)
-# compute total power of both strings
-powerTotal = currentValues['PVOutput']['Power_PV1'] + currentValues['PVOutput']['Power_PV2']
-if powerTotal < 10:
-    # this usually happens at the beginning of a new day
-    logging.warning("Zero power, ignoring today's energy yield (could be from yesterday)")
-    print("Zero power, ignoring today's energy yield (could be from yesterday)")
-    sys.exit(1)
-if float(configParser.get('pvoutput', 'pvo_system_size')) > 0 and powerTotal > 1200 * float(configParser.get('pvoutput', 'pvo_system_size')):
-    # allow 20% larger production than system size (e.g. a cold windy and sunny day)
-    logging.error("Total power much larger than system size -> ignoring...")
-    print("Total power much larger than system size -> ignoring...")
-    sys.exit(1)
-
-# upload data to pvoutput.org
-now = datetime.now()  # current date and time
-uploadStr = configParser.get('pvoutput', 'pvo_single_url') + configParser.get('pvoutput', 'pvo_apikey') + "&sid=" + configParser.get('pvoutput', 'pvo_systemid') + "&d=" + str(now.strftime("%Y%m%d")) + "&t=" + str(now.strftime("%H:%M")) + "&c1=0" + "&v1=" + str(int(currentValues['EnergyTodayTotals']['PV_Generation_Today'] * 1000)) + "&v2=" + str(powerTotal)
-# handle optional pvoutput.org parameters
-if bool(configParser.get('pvoutput', 'pvo_upload_temperature')):
-    uploadStr = uploadStr + "&v5=" + str(currentValues['SystemInfo']['Temperature_Env1'])
-if bool(configParser.get('pvoutput', 'pvo_upload_voltage')):
-    uploadStr = uploadStr + "&v6=" + str(currentValues['GridOutput']['Voltage_Phase_R'])
-for i in range(7, 13, 1):
-    tmp = configParser.get('pvoutput', 'pvo_v' + str(i))
-    if isValidString(tmp):
+        return None
+    # compute total power of both strings
+    powerTotal = currentValues['PVOutput']['Power_PV1'] + currentValues['PVOutput']['Power_PV2']
+    if powerTotal < 10:
+        # this usually happens at the beginning of a new day
+        logging.warning("Zero power, ignoring today's energy yield (could be from yesterday)")
+        print("Zero power, ignoring today's energy yield (could be from yesterday)")
+        return None
+    if cfg['system_size'] > 0 and powerTotal > 1200 * cfg['system_size']:
+        # allow 20% larger production than system size (e.g. a cold windy and sunny day)
+        logging.error("Total power much larger than system size -> ignoring...")
+        print("Total power much larger than system size -> ignoring...")
+        return None
+    return currentValues, powerTotal
+
+
+def upload(cfg, currentValues, powerTotal):
+    # upload data to pvoutput.org
+    now = datetime.now()  # current date and time
+    # the url may still contain the query start from older config files
+    pvoSingleUrl = cfg['single_url'].split('?', 1)[0]
+    params = {'key': cfg['apikey'],
+              'sid': cfg['systemid'],
+              'd': now.strftime("%Y%m%d"),
+              't': now.strftime("%H:%M"),
+              'c1': 0,
+              'v1': int(currentValues['EnergyTodayTotals']['PV_Generation_Today'] * 1000),
+              'v2': powerTotal}
+    # handle optional pvoutput.org parameters
+    if cfg['upload_temp']:
+        params['v5'] = currentValues['SystemInfo']['Temperature_Env1']
+    if cfg['upload_volt']:
+        params['v6'] = currentValues['GridOutput']['Voltage_Phase_R']
+    for i, regRangeName, regName in cfg['optional_vs']:
         try:
-            tmp = tmp.split('.')
-            uploadStr = uploadStr + "&v" + str(i) + "=" + str(int(currentValues[tmp[0]][tmp[1]]))
+            params['v' + str(i)] = int(currentValues[regRangeName][regName])
         except Exception as err:
             logging.warning("Optional pvoutput parameter pvo_v%d failed: %s", i, err)
-            continue
-r = requests.get(uploadStr)
-if r.status_code != 200:
-    logging.error('Uploader to pvoutput.org failed: %s', r.text)
-    print('Uploader to pvoutput.org failed: ', r.text)
+    try:
+        r = _session.get(pvoSingleUrl, params=params, timeout=10)
+    except requests.RequestException as err:
+        logging.error('Uploader to pvoutput.org failed: %s', err)
+        print('Uploader to pvoutput.org failed: ', err)
+        return False
+    if r.status_code != 200:
+        logging.error('Uploader to pvoutput.org failed: %s', r.text)
+        print('Uploader to pvoutput.org failed: ', r.text)
+        return False
+    return True
+
+
+def main():
+    os.chdir(os.path.dirname(sys.argv[0]))
+    signal.signal(signal.SIGTERM, _terminate)
+
+    # handle config file
+    configParser = configparser.RawConfigParser()
+    configFilePath = Path(os.getcwd())
+    configFilePath = configFilePath.joinpath('config.cfg')
+    if not configFilePath.is_file():
+        print('Config file not found at: ' + str(configFilePath))
+        sys.exit(1)
+    configParser.read(configFilePath)
+    # prepare log file
+    allowedLogLevels = ['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG']
+    cfgLogLevel = configParser.get('general', 'log_level')
+    if not isValidString(cfgLogLevel) or not (cfgLogLevel.upper()) in allowedLogLevels:
+        configParser.set('general', 'log_level', 'ERROR')
+    logPath = Path(configParser.get('general', 'log_path'))
+    if not logPath.is_dir():
+        logPath = Path(os.getcwd())
+    logging.basicConfig(filename=logPath.joinpath('sofar2PVO.log'), filemode='a', level=getattr(logging, configParser.get('general', 'log_level')), format='%(asctime)s - %(levelname)s: %(message)s')
+    # open protocol file
+    sofarProtocolPath = Path(os.getcwd())
+    sofarProtocolPath = sofarProtocolPath.joinpath('sofarProtocol.json')
+    if not sofarProtocolPath.is_file():
+        logging.error('File with protocol definition not found at: ' + str(sofarProtocolPath))
+        print('File with protocol definition not found at: ' + str(sofarProtocolPath))
+        sys.exit(1)
+    protocolMtime = os.stat(sofarProtocolPath).st_mtime
+    sofarProtocol = loadProtocol(sofarProtocolPath)
+    # read all remaining config values once
+    try:
+        interval = configParser.get('general', 'interval', fallback='')
+        systemSize = configParser.get('pvoutput', 'pvo_system_size')
+        cfg = {'interval': float(interval) if isValidString(interval) else 0.0,
+               'inverter_ip': configParser.get('SofarInverter', 'inverter_ip'),
+               'inverter_port': int(configParser.get('SofarInverter', 'inverter_port')),
+               'inverter_sn': int(configParser.get('SofarInverter', 'inverter_sn')),
+               'system_size': float(systemSize) if isValidString(systemSize) else 0.0,
+               'apikey': configParser.get('pvoutput', 'pvo_apikey'),
+               'systemid': configParser.get('pvoutput', 'pvo_systemid'),
+               'single_url': configParser.get('pvoutput', 'pvo_single_url'),
+               'upload_temp': getFlag(configParser, 'pvoutput', 'pvo_upload_temperature'),
+               'upload_volt': getFlag(configParser, 'pvoutput', 'pvo_upload_voltage'),
+               'optional_v': {i: configParser.get('pvoutput', 'pvo_v' + str(i), fallback='') for i in range(7, 13)}}
+    except (configparser.Error, ValueError) as err:
+        logging.error('Invalid config file: %s', err)
+        print('Invalid config file: ' + str(err))
+        sys.exit(1)
+    # check optional pvoutput.org parameters
+    allRegRanges = ['GridOutput', 'SystemInfo', 'EnergyTodayTotals', 'PVOutput']
+    requiredRegRanges = ['GridOutput', 'EnergyTodayTotals', 'PVOutput']
+    if cfg['upload_temp']:
+        requiredRegRanges += ['SystemInfo']
+    # list of (parameter number, register range, register name) of the valid optional parameters
+    cfg['optional_vs'] = []
+    for i in range(7, 13, 1):
+        tmp = cfg['optional_v'][i]
+        if isValidString(tmp):
+            tmp = tmp.split('.')
+            if len(tmp) == 2 and tmp[0] in allRegRanges:
+                cfg['optional_vs'] += [(i, tmp[0], tmp[1])]
+    requiredRegRanges += [regRangeName for i, regRangeName, regName in cfg['optional_vs']]
+    requiredRegRanges = list(dict.fromkeys(requiredRegRanges))  # only unique list items, keeping their order
+    # check if ip address is valid
+    try:
+        ipaddress.ip_address(cfg['inverter_ip'])
+    except Exception as err:
+        logging.error('IP address: \'%s\' is not valid', str(cfg['inverter_ip']))
+        print('IP address: \'' + str(cfg['inverter_ip']) + '\' is not valid.')
+        sys.exit(1)
+    # create object to connect to the inverter, keep the connection open if we upload periodically
+    with sofarDevice(cfg['inverter_ip'], cfg['inverter_port'], cfg['inverter_sn'], cfg['system_size'], sofarProtocol,
+                     keepAlive=cfg['interval'] > 0) as sDev:
+        try:
+            while True:
+                cycleStart = time.monotonic()
+                try:
+                    mtime = os.stat(sofarProtocolPath).st_mtime
+                    if mtime != protocolMtime:
+                        # protocol definition has been modified -> use the new one
+                        protocolMtime = mtime
+                        sDev.setProtocol(loadProtocol(sofarProtocolPath))
+                        logging.info('Reloaded protocol definition from: %s', str(sofarProtocolPath))
+                except (OSError, ValueError, RuntimeError) as err:
+                    # keep using the current protocol definition
+                    logging.error('Reloading protocol definition failed: %s', err)
+                try:
+                    pvData = collect(sDev, cfg, requiredRegRanges)
+                    uploadOk = bool(pvData) and upload(cfg, *pvData)
+                except Exception as err:
+                    # do not let a single failed cycle end periodic uploads, start over with a new connection
+                    logging.exception('Reading or uploading pv data failed: %s', err)
+                    print('Reading or uploading pv data failed: ', err)
+                    sDev.close()
+                    uploadOk = False
+                if cfg['interval'] <= 0:
+                    # single run (e.g. by cron)
+                    sys.exit(0 if uploadOk else 1)
+                time.sleep(max(0.0, cfg['interval'] - (time.monotonic() - cycleStart)))
+        finally:
+            _session.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -20,15 +20,41 @@
 #           via logger module LSW-3/LSE. Requires IP address, port, serial number of the inverter,
 #           total power of the connected pv modules (in kW), and the inverters / loggers protocol definition.
 #           Set system size to 0 to disable checking the received data for plausibility.
+#           Use it in a with-statement (with sofarDevice(...) as sDev:) to close the connection to the inverter.
 #
 
-import binascii
 import ipaddress
 import logging
 import socket
+import struct
 import time
 
-import libscrc
+# codes of the supported register value types and their number of bytes and signedness (indexed by code)
+_valueTypeCodes = {'u16': 0, 'u32': 1, 'i16': 2, 'i32': 3}
+_valueSpecs = ((2, False), (4, False), (2, True), (4, True))
+# register ranges which are at most this many registers apart are read with a single request
+_maxRegisterGap = 4
+# a modbus read request is limited to 125 registers
+_maxRegistersPerRequest = 125
+
+
+def _crc16ModbusByte(byte):
+    # crc16 modbus (reflected polynomial 0xA001) of a single byte
+    crc = byte
+    for i in range(8):
+        crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+
+_crc16ModbusTable = [_crc16ModbusByte(byte) for byte in range(256)]
+
+
+def crc16Modbus(data):
+    # table driven crc16 modbus of a bytes-like object
+    crc = 0xFFFF
+    for byte in data:
+        crc = (crc >> 8) ^ _crc16ModbusTable[(crc ^ byte) & 0xFF]
+    return crc
 
 
 class sofarDevice:
@@ -37,10 +63,16 @@ class sofarDevice:
     mySerialNumber = None
     mySocket = None
     mySystemSize = 0
+    myReadTimeout = 2
+    myKeepAlive = False
     sofarProtocol = dict()
     _connectedToInverterFlag = False
+    _pipelineRequestsFlag = True
+    # consecutive read timeouts on the current connection and the number after which it is reopened
+    _readTimeoutCounter = 0
+    _maxReadTimeouts = 2
 
-    def __init__(self, ip, port, serial, systemSize, sofarProto):
+    def __init__(self, ip, port, serial, systemSize, sofarProto, keepAlive=False):
         # constructor
         if isinstance(ip, str) and ipaddress.ip_address(ip):
             self.myIP = ip
@@ -50,61 +82,105 @@ class sofarDevice:
             self.myPort = int(port)
         else:
             raise RuntimeError("input argument \'port\' expected to be a number, got %s instead.", type(port))
+        # the ip address does not change -> resolve the socket address only once
+        try:
+            self._addrInfo = socket.getaddrinfo(self.myIP, self.myPort, socket.AF_INET, socket.SOCK_STREAM)
+        except socket.gaierror as err:
+            raise RuntimeError("input argument \'ip\' expected to be a valid IPv4 address, got %s instead.", str(ip))
         if isinstance(serial, int) or isinstance(serial, float):
             self.mySerialNumber = int(serial)
         else:
             raise RuntimeError("input argument \'serial\' expected to be a number, got %s instead.", type(serial))
+        # constant parts of the request frame
+        self._headerPrefix = bytes.fromhex('A5' '1700' '1045' '0000')  # Logger Start code, frame DataLength, ControlCode, Serial
+        self._serialLE = struct.pack('<I', self.mySerialNumber)  # inverter serial number, little endian
+        self._padding = bytes.fromhex('020000000000000000000000000000')  # com.igen.localmode.dy.instruction.send.SendDataField
+        self._endByte = b'\x15'  # Logger End code
         if isinstance(systemSize, int) or isinstance(systemSize, float):
             self.mySystemSize = float(systemSize)
         else:
             raise RuntimeError("input argument \'systemSize\' expected to be a number, got %s instead.", type(systemSize))
-        if isinstance(sofarProto, dict):
-            self.sofarProtocol = sofarProto
-        else:
-            raise RuntimeError("input argument \'protocol\' expected to be a dict, got %s instead.", type(sofarProto))
+        self.setProtocol(sofarProto)
+        # keep the connection to the inverter open after a successful read, e.g. for periodic reads
+        self.myKeepAlive = bool(keepAlive)
 
     def __enter__(self):
         # for with-statement
         return self
 
 
-    def __del__(self):
-        # destructor
-        if(self.mySocket):
-            try:
-                self.mySocket.close()
-            except Exception as err:
-                return
-
-
     def __exit__(self, exc_type, exc_value, traceback):
-        # for with-statement
+        # for with-statement, closes the connection to the inverter
+        self.close()
+
+    def close(self):
+        # close the connection to the inverter, it is reopened by the next read
         if (self.mySocket):
             try:
                 self.mySocket.close()
             except Exception as err:
-                return
+                pass
+        self.mySocket = None
+        self._connectedToInverterFlag = False
 
 
     @staticmethod
-    def padhex(s):
-        return '0x' + s[2:].zfill(4)
+    def isValidString(s):
+        return bool(isinstance(s, str) and s and not s.isspace())
+
+    def setProtocol(self, sofarProto):
+        # use a (new) protocol definition
+        if isinstance(sofarProto, dict):
+            self.sofarProtocol = self.prepareProtocol(sofarProto)
+        else:
+            raise RuntimeError("input argument \'protocol\' expected to be a dict, got %s instead.", type(sofarProto))
 
     @staticmethod
-    def hex_zfill(intval):
-        hexvalue = hex(intval)
-        return '0x' + str(hexvalue)[2:].zfill(4)
+    def prepareProtocol(sofarProto):
+        # precompute register numbers, a register lookup by offset, the factors and value types of all register ranges
+        for regRangeDef in sofarProto.values():
+            if not isinstance(regRangeDef, dict) or '_byOffset' in regRangeDef:
+                # not a register range or already prepared
+                continue
+            if 'registerStart' not in regRangeDef or 'registerEnd' not in regRangeDef:
+                continue
+            regRangeDef['_regStart'] = int(regRangeDef['registerStart'], 0)
+            regRangeDef['_regEnd'] = int(regRangeDef['registerEnd'], 0)
+            regRangeDef['_byOffset'] = [regRangeDef.get('0x%04X' % reg) for reg in range(regRangeDef['_regStart'], regRangeDef['_regEnd'] + 1)]
+            for regDef in regRangeDef['_byOffset']:
+                if regDef is None:
+                    continue
+                try:
+                    regDef['_factor'] = float(regDef.get('factor', 1))
+                except:
+                    regDef['_factor'] = 1
+                regDef['_tcode'] = _valueTypeCodes.get(regDef.get('valueType'), -1)
+        return sofarProto
 
     @staticmethod
-    def isValidString(s):
-        return bool(isinstance(s, str) and s and not s.isspace())
+    def _replyLength(regRangeDef):
+        # logger frame (25 bytes) + modbus reply (3 bytes, 2 bytes per register, 2 bytes crc) + checksum + end code
+        return 2 * (regRangeDef['_regEnd'] - regRangeDef['_regStart'] + 1) + 32
 
+    @staticmethod
+    def _isValidReply(frame):
+        # check start code, length, checksum and end code of the logger frame and the crc of the modbus reply
+        frame = memoryview(frame)
+        if len(frame) < 32 or frame[0] != 0xA5 or frame[-1] != 0x15:
+            return False
+        if struct.unpack_from('<H', frame, 1)[0] + 13 != len(frame):
+            return False
+        if sum(frame[1:-2]) & 0xFF != frame[-2]:
+            return False
+        # the crc over the modbus reply including its crc is zero
+        return crc16Modbus(frame[25:-2]) == 0
 
     def _connect(self):
         # OPEN SOCKET
-        self.mySocket = []
+        self.mySocket = None
         self._connectedToInverterFlag = False
-        for res in socket.getaddrinfo(self.myIP, self.myPort, socket.AF_INET, socket.SOCK_STREAM):
+        self._readTimeoutCounter = 0
+        for res in self._addrInfo:
             family, socktype, proto, canonname, sockadress = res
             try:
                 self.mySocket = socket.socket(family, socktype, proto)
@@ -112,11 +188,12 @@ class sofarDevice:
                 self.mySocket.connect(sockadress)
                 self._connectedToInverterFlag = True
             except socket.error as msg:
-                logging.error(
-                    'Could not open socket ' + self.myIP + ':' + str(self.myPort) + ' - inverter (' + str(
-                        self.mySerialNumber) + ') turned off? Message: ' + msg.strerror)
+                # socket.timeout has no strerror -> use the string representation of the error
+                logging.error('Could not open socket %s:%d - inverter (%d) turned off? Message: %s',
+                              self.myIP, self.myPort, self.mySerialNumber, msg)
                 print('Could not open socket ' + self.myIP + ':' + str(self.myPort) + ' - inverter (' + str(
-                    self.mySerialNumber) + ') turned off? Message: ' + msg.strerror)
+                    self.mySerialNumber) + ') turned off? Message: ' + str(msg))
+                self.close()
                 break
         if not self._connectedToInverterFlag:
             # connection failed -> wait a bit and try again
@@ -124,35 +201,20 @@ class sofarDevice:
 
     def _generateRequest(self, regRangeDef):
         # generate request for inverter to send register data
-        if 'registerStart' not in regRangeDef or 'registerEnd' not in regRangeDef:
+        if '_regStart' not in regRangeDef or '_regEnd' not in regRangeDef:
             logging.error('register range definition does not contain start and/or end register')
             return False
         # generate modbus request
-        regStart = int(regRangeDef['registerStart'], 0)
-        regEnd = int(regRangeDef['registerEnd'], 0)
-        requestBytes = bytearray(36)
-        requestBytes[0:1] = binascii.unhexlify('A5')  # Logger Start code
-        requestBytes[1:3] = binascii.unhexlify('1700')  # Logger frame DataLength
-        requestBytes[3:5] = binascii.unhexlify('1045')  # Logger ControlCode
-        requestBytes[5:7] = binascii.unhexlify('0000')  # Serial
-        requestBytes[7:11] = bytearray.fromhex(
-            hex(self.mySerialNumber)[8:10] + hex(self.mySerialNumber)[6:8] + hex(self.mySerialNumber)[4:6] + hex(self.mySerialNumber)[2:4])
-        requestBytes[11:26] = binascii.unhexlify(
-            '020000000000000000000000000000')  # com.igen.localmode.dy.instruction.send.SendDataField
+        regStart = regRangeDef['_regStart']
+        regEnd = regRangeDef['_regEnd']
         # Data logger frame begin
         # Modbus request begin
-        businessfield = binascii.unhexlify(
-            '0003' + str(self.hex_zfill(regStart)[2:]) + str(
-                self.hex_zfill(regEnd - regStart + 1)[2:]))  # Modbus data to count crc
-        requestBytes[26:32] = businessfield
-        requestBytes[32:34] = binascii.unhexlify(str(self.padhex(hex(libscrc.modbus(businessfield)))[4:6]) + str(
-            self.padhex(hex(libscrc.modbus(businessfield)))[2:4]))  # CRC16modbus
+        businessfield = b'\x00\x03' + struct.pack('>HH', regStart, regEnd - regStart + 1)  # Modbus data to count crc
+        requestBytes = bytearray(self._headerPrefix + self._serialLE + self._padding + businessfield
+                                 + struct.pack('<H', crc16Modbus(businessfield))  # CRC16modbus
+                                 + b'\x00' + self._endByte)  # checksum placeholder, Logger End code
         # compute checksum
-        checksum = 0
-        for i in range(1, 34, 1):
-            checksum += requestBytes[i] & 255
-        requestBytes[34] = int((checksum & 255))
-        requestBytes[35:36] = binascii.unhexlify('15')  # Logger End code
+        requestBytes[34] = sum(memoryview(requestBytes)[1:34]) & 0xFF
         return requestBytes
 
     def getRegisterRangeData(self, requestedRegRangeDefs):
@@ -160,159 +222,217 @@ class sofarDevice:
         # make sure requested register ranges are valid
         if self.isValidString(requestedRegRangeDefs):
             requestedRegRangeDefs = [requestedRegRangeDefs]
-        requestedRegRangeDefs = list(set(requestedRegRangeDefs))  # only unique list items
         requiredRegRanges = ['EnergyTodayTotals', 'PVOutput']
-        for reqRange in requiredRegRanges:
-            if reqRange not in requestedRegRangeDefs:
-                requestedRegRangeDefs += [requiredRegRanges[0]]
-        for reqRange in requestedRegRangeDefs:
-            if reqRange not in self.sofarProtocol:
-                requestedRegRangeDefs.remove(reqRange)
-        # allow up to 10 retries to connect to the inverter and obtain the data
+        # only unique list items (keeping their order) which are defined in the protocol
+        requestedRegRangeDefs = [reqRange for reqRange in dict.fromkeys(list(requestedRegRangeDefs) + requiredRegRanges)
+                                 if reqRange in self.sofarProtocol]
+        regSpans = self._mergeRegisterRanges(requestedRegRangeDefs)
+        # allow up to 10 tries to connect to the inverter and obtain the data
         maxRetries = 10
-        for retryCounter in range(1, maxRetries, 1):
-            logging.debug('Inverter communication try #%d', retryCounter)
+        for retryCounter in range(maxRetries):
+            if retryCounter:
+                # wait a bit before the next try, a little longer after each failed try
+                time.sleep(min(10, 0.5 * 2 ** retryCounter))
+            logging.debug('Inverter communication try #%d', retryCounter + 1)
+            if self._connectedToInverterFlag:
+                # reuse the existing connection, but drop answers which arrived after a previous read timed out
+                self._discardPendingData()
             # check connection
             if not self._connectedToInverterFlag:
                 self._connect()
                 if not self._connectedToInverterFlag:
-                    # no connection -> wait a bit and retry
-                    time.sleep(10)
+                    # no connection -> retry
                     continue
-            # connection established
-            logging.info('Successfully connected to inverter (' + str(self.mySerialNumber) + ') at ' + self.myIP + ':' + str(self.myPort))
-            output = {}
-            for regRangeName in requestedRegRangeDefs:
-                regRangeDef = self.sofarProtocol[regRangeName]
-                requestBytes = self._generateRequest(regRangeDef)
-                # send request for register range to inverter
-                try:
-                    self.mySocket.sendall(requestBytes)
-                except Exception as err:
-                    logging.error("Sending request to inverter failed: ", err)
-                    self.mySocket.close()
-                    self._connectedToInverterFlag = False
-                    break
-                logging.debug("Sent request to inverter: %s", str(requestBytes))
-                # give the inverter some time to send data back
-                time.sleep(1)
-                # read the answer from the inverter
-                regRangeVals = self._readRegisterRange(regRangeDef)
-                if regRangeVals and isinstance(regRangeDef, dict):
-                    output[regRangeName] = regRangeVals
-                else:
-                    self.mySocket.close()
-                    self._connectedToInverterFlag = False
-                    break
-            # collected all data or some sort of error occurred
-            if not self._connectedToInverterFlag:
-                # something went wrong -> retry
-                time.sleep(10)
-                continue
+                logging.info('Successfully connected to inverter (' + str(self.mySerialNumber) + ') at ' + self.myIP + ':' + str(self.myPort))
+            if self._pipelineRequestsFlag:
+                # send all requests at once and read all answers in one go
+                output = self._readRegisterSpans(regSpans)
+            else:
+                output = {}
+                for spanDef in regSpans:
+                    # send request for register span to inverter and read its answer
+                    if not self._sendRequest(self._generateRequest(spanDef)):
+                        break
+                    spanVals = self._readRegisterSpan(spanDef)
+                    if not spanVals:
+                        break
+                    output.update(spanVals)
             # sanity check of the received data
-            for regRangeName in requestedRegRangeDefs:
-                if regRangeName not in output:
-                    # required registers have not been read from the inverter
-                    self.mySocket.close()
-                    self._connectedToInverterFlag = False
-                    time.sleep(10)
-                    continue
+            if not output or any(regRangeName not in output for regRangeName in requestedRegRangeDefs):
+                # connection failed or required registers have not been read from the inverter -> retry
+                continue
             power_total = output['PVOutput']['Power_PV1'] + output['PVOutput']['Power_PV2']
             if self.mySystemSize and (output['EnergyTodayTotals']['PV_Generation_Today'] > 10 * self.mySystemSize or power_total > 1200 * self.mySystemSize):
                 # this value does not make sense, wait a bit and try again
                 logging.debug('Value for \'energy today\': ' + str(
                     output['EnergyTodayTotals']['PV_Generation_Today']) + ' or \'power\': ' + str(
                     power_total) + ' too large - retrying...')
+                continue
+            # all done, data seems ok
+            if not self.myKeepAlive:
                 self.mySocket.close()
                 self._connectedToInverterFlag = False
-                time.sleep(10)
+            return output
+        # all trials failed -> do not reuse this connection for the next read
+        self.close()
+        return False
+
+    def _sendRequest(self, requestBytes):
+        # send request(s) to the inverter, close the connection if this fails
+        try:
+            self.mySocket.sendall(requestBytes)
+        except Exception as err:
+            logging.error("Sending request to inverter failed: %s", err)
+            self.mySocket.close()
+            self._connectedToInverterFlag = False
+            return False
+        logging.debug("Sent request to inverter: %s", str(requestBytes))
+        return True
+
+    def _discardPendingData(self):
+        # empty the receive buffer of the socket without waiting for new data
+        try:
+            self.mySocket.settimeout(0)
+            while self.mySocket.recv(1024):
+                pass
+            # inverter closed the connection
+            self.mySocket.close()
+            self._connectedToInverterFlag = False
+        except (BlockingIOError, socket.timeout):
+            # nothing (left) to read
+            self.mySocket.settimeout(15)
+        except Exception as err:
+            logging.debug("Connection failed: %s", err)
+            self.mySocket.close()
+            self._connectedToInverterFlag = False
+
+    def _mergeRegisterRanges(self, regRangeNames):
+        # merge adjacent or overlapping register ranges into spans which are read with a single request
+        regSpans = []
+        for regRangeName in sorted(regRangeNames, key=lambda name: self.sofarProtocol[name].get('_regStart', 0)):
+            regRangeDef = self.sofarProtocol[regRangeName]
+            if '_regStart' not in regRangeDef or '_regEnd' not in regRangeDef:
+                logging.error('register range definition does not contain start and/or end register')
                 continue
+            if regSpans and regRangeDef['_regStart'] <= regSpans[-1]['_regEnd'] + _maxRegisterGap \
+                    and max(regSpans[-1]['_regEnd'], regRangeDef['_regEnd']) - regSpans[-1]['_regStart'] < _maxRegistersPerRequest:
+                regSpans[-1]['_regEnd'] = max(regSpans[-1]['_regEnd'], regRangeDef['_regEnd'])
+                regSpans[-1]['_members'] += [regRangeName]
             else:
-                # all done, data seems ok
-                return output
-        # all trials failed, no data to return
-        return False
+                regSpans += [{'_regStart': regRangeDef['_regStart'], '_regEnd': regRangeDef['_regEnd'], '_members': [regRangeName]}]
+        for spanDef in regSpans:
+            spanDef['_replyLength'] = self._replyLength(spanDef)
+        return regSpans
+
+    def _readRegisterSpans(self, regSpans):
+        # request several register spans at once and split the answer into the individual reply frames
+        if not self._sendRequest(b''.join(self._generateRequest(spanDef) for spanDef in regSpans)):
+            return False
+        # read the answers from the inverter
+        data = self._receive(sum(spanDef['_replyLength'] for spanDef in regSpans))
+        if not data:
+            # no answer at all (e.g. timeout) -> this does not tell us whether the logger handles back-to-back requests
+            return False
+        output = {}
+        offset = 0
+        for spanDef in regSpans:
+            frameLen = spanDef['_replyLength']
+            if not self._isValidReply(data[offset:offset + frameLen]):
+                logging.debug("Invalid answer from inverter for register range(s) %s", ', '.join(spanDef['_members']))
+                # answers arrived but are incomplete or invalid -> the logger might not handle back-to-back requests,
+                # request one register span at a time from now on
+                logging.info('Pipelined requests failed, falling back to sequential requests')
+                self._pipelineRequestsFlag = False
+                return False
+            spanVals = self._parseRegisterSpan(spanDef, data[offset:offset + frameLen])
+            if not spanVals:
+                return False
+            output.update(spanVals)
+            offset += frameLen
+        return output
 
-    def _readRegisterRange(self, regRangeDef):
+    def _readRegisterSpan(self, spanDef):
         # read data transmitted from the inverter
         if not self._connectedToInverterFlag or not self.mySocket:
             return False
-        # check if register range is valid
-        if 'registerStart' not in regRangeDef or 'registerEnd' not in regRangeDef:
-            logging.error('register range definition does not contain start and/or end register')
+        data = self._receive(spanDef['_replyLength'])
+        if not data:
             return False
-        regStart = int(regRangeDef['registerStart'], 0)
-        regEnd = int(regRangeDef['registerEnd'], 0)
-        # read the answer from the inverter
+        if not self._isValidReply(data[:spanDef['_replyLength']]):
+            logging.debug("Invalid answer from inverter for register range(s) %s", ', '.join(spanDef['_members']))
+            return False
+        return self._parseRegisterSpan(spanDef, data)
+
+    def _receive(self, expected_len):
+        # read an answer of expected_len bytes from the inverter
+        if not self._connectedToInverterFlag or not self.mySocket:
+            return False
+        # the answer usually arrives well within the short read timeout
+        self.mySocket.settimeout(self.myReadTimeout)
+        # receive into a preallocated buffer, leaving some room for bytes beyond the expected answer
+        buffer = memoryview(bytearray(expected_len + 64))
+        received = 0
         okFlag = True
-        data = b''
         while okFlag:
             try:
-                chunk = self.mySocket.recv(1024)
-                # try:
-                if not chunk:
+                numBytes = self.mySocket.recv_into(buffer[received:])
+                if not numBytes:
                     print("No data received from inverter")
                     logging.error("No data received from inverter")
                     self.mySocket.close()
                     self._connectedToInverterFlag = False
                     break
-                data = data + chunk
-                if data.__len__() >= (regEnd - regStart + 1) + 60 / 4:
-                    # we collected enough data, any data beyond this will not be parsed
+                received += numBytes
+                if received >= expected_len:
+                    # we collected the complete answer
                     break
             except socket.timeout as msg:
                 logging.debug("Connection timeout - inverter and/or gateway is offline: %s", msg)
                 break
             except Exception as err:
                 logging.debug("Connection failed: %s", err)
+                self.mySocket.close()
                 self._connectedToInverterFlag = False
                 break
-        if not data:
-            # got no data from the inverter -> abort
-            self.mySocket.close()
-            self._connectedToInverterFlag = False
         if not self._connectedToInverterFlag:
-            # connection timed out or receiving data failed -> abort reading data from inverter
+            # receiving data failed -> abort reading data from inverter
             return False
-            # break
-        # parse data from the inverter
+        self.mySocket.settimeout(15)
+        if not received:
+            # got no data from the inverter in time -> abort, keep the connection for the next try only once
+            self._readTimeoutCounter += 1
+            if self._readTimeoutCounter >= self._maxReadTimeouts:
+                logging.debug("No answer from inverter %d times in a row - reconnecting", self._readTimeoutCounter)
+                self.close()
+            return False
+        self._readTimeoutCounter = 0
+        data = bytes(buffer[:received])
         logging.debug("Data received from inverter: " + str(data))
+        return data
+
+    def _parseRegisterSpan(self, spanDef, data):
+        # split the answer for a register span into its register ranges
         output = {}
-        for idx in range(0, regEnd - regStart + 1, 1):
-            idxStart = 28 + (idx * 2)
-            idxEnd16 = idxStart + 2  # 16-bit value
-            idxEnd32 = idxStart + 4  # 32-bit value
-            if idxEnd16 > len(data):
-                break
-            hexpos = str("0x") + str(hex(idx + regStart)[2:].zfill(4)).upper()
-            if hexpos not in regRangeDef:
-                # register not found in register range definition
-                continue
-            regDef = regRangeDef[hexpos]
-            try:
-                factor = float(regDef['factor'])
-            except:
-                factor = 1
-            # match regDef['valueType']:  # requires python 3.10
-            #     case 'u16':
-            #         val = int.from_bytes(data[idxStart:idxEnd16], "big", signed="False") * factor
-            #     case 'u32':
-            #         val = int.from_bytes(data[idxStart:idxEnd32], "big", signed="False") * factor
-            #     case 'i16':
-            #         val = int.from_bytes(data[idxStart:idxEnd16], "big", signed="True") * factor
-            #     case 'i32':
-            #         val = int.from_bytes(data[idxStart:idxEnd32], "big", signed="True") * factor
-            #     case _:
-            #         continue
-            if regDef['valueType'] == 'u16':
-                val = int.from_bytes(data[idxStart:idxEnd16], "big", signed="False") * factor
-            elif regDef['valueType'] == 'u32':
-                val = int.from_bytes(data[idxStart:idxEnd32], "big", signed="False") * factor
-            elif regDef['valueType'] == 'i16':
-                val = int.from_bytes(data[idxStart:idxEnd16], "big", signed="True") * factor
-            elif regDef['valueType'] == 'i32':
-                val = int.from_bytes(data[idxStart:idxEnd32], "big", signed="True") * factor
-            else:
+        for regRangeName in spanDef['_members']:
+            regRangeVals = self._parseRegisterRange(self.sofarProtocol[regRangeName], data, spanDef['_regStart'])
+            if not regRangeVals:
+                return False
+            output[regRangeName] = regRangeVals
+        return output
+
+    @staticmethod
+    def _parseRegisterRange(regRangeDef, data, firstRegister):
+        # parse data from the inverter, the answer starts with register firstRegister
+        data = memoryview(data)
+        dataStart = 28 + 2 * (regRangeDef['_regStart'] - firstRegister)
+        output = {}
+        for idx, regDef in enumerate(regRangeDef['_byOffset']):
+            if regDef is None or regDef['_tcode'] < 0:
+                # register not found in register range definition or unknown value type
                 continue
-            output[regDef['name']] = val
-        return output
\ No newline at end of file
+            numBytes, signed = _valueSpecs[regDef['_tcode']]
+            idxStart = dataStart + (idx * 2)
+            if idxStart + numBytes > len(data):
+                break
+            output[regDef['name']] = int.from_bytes(data[idxStart:idxStart + numBytes], "big", signed=signed) * regDef['_factor']
+        return output